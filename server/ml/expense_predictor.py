@@ -1,110 +1,311 @@
-import tensorflow as tf
 import numpy as np
-import pandas as pd
-from sklearn.preprocessing import StandardScaler
-import joblib
 import os
 import sys
+import math
+import time
+from collections import OrderedDict
+from functools import lru_cache
 from pathlib import Path
 
 # Get the directory containing this script
 SCRIPT_DIR = Path(__file__).parent.absolute()
 
-class ExpensePredictor:
-    def __init__(self):
-        model_path = SCRIPT_DIR / 'expense_predictor.keras'
-        scaler_path = SCRIPT_DIR / 'scaler.save'
+# Number of distinct (quantized) inputs whose raw model output is kept in memory
+PREDICTION_CACHE_SIZE = 4096
+
+def _quantize(value, significant_digits=3):
+    """Round a value to a few significant figures so near-identical inputs share a cache entry"""
+    if value == 0:
+        return 0.0
+    return round(value, significant_digits - 1 - int(math.floor(math.log10(abs(value)))))
+
+def _quantize_rows(inputs):
+    """Quantize the income, expenses and savings of (n, 4) input rows as predict() does for its cache key
+    
+    Keeps batched predictions identical to single (cached) ones for the same request.
+    """
+    return np.array([
+        (_quantize(income), _quantize(expenses), month, _quantize(savings))
+        for income, expenses, month, savings in inputs.tolist()
+    ], dtype=np.float64).reshape(-1, 4)
+
+def has_scaler(scaler_path):
+    """Whether scaler stats exist at scaler_path (.npz) or as a legacy pickled scaler (.save)"""
+    scaler_path = Path(scaler_path)
+    return scaler_path.exists() or scaler_path.with_suffix('.save').exists()
+
+def load_scaler_stats(scaler_path):
+    """Load the scaler (mean, scale) from a .npz file as float32 arrays
+    
+    Falls back to the pickled StandardScaler (.save) written by older versions of
+    train_model.py; run model_export.py to convert those.
+    """
+    scaler_path = Path(scaler_path)
+    
+    if scaler_path.exists():
+        with np.load(scaler_path) as stats:
+            return stats['mean'].astype(np.float32), stats['scale'].astype(np.float32)
+    
+    import joblib
+    scaler = joblib.load(str(scaler_path.with_suffix('.save')))
+    return scaler.mean_.astype(np.float32), scaler.scale_.astype(np.float32)
+
+def save_scaler_stats(scaler_path, mean, scale):
+    """Save scaler (mean, scale) as a small .npz file, loaded with load_scaler_stats"""
+    np.savez(scaler_path, mean=np.asarray(mean, dtype=np.float32), scale=np.asarray(scale, dtype=np.float32))
+
+# Number of loaded models kept per process (the base model plus recently used user models)
+MAX_INFERENCE_MODELS = 256
+
+# Seconds a cached model is used before its files are checked for changes again
+MODEL_RELOAD_CHECK_INTERVAL = 1.0
+
+# model path -> (time of last check, model file mtimes, inference callable), shared by every
+# predictor in the process, least recently used first
+_inference_models = OrderedDict()
+
+def load_inference_model(model_path, scaler_path):
+    """Load a model for inference on raw [income, expenses, month, savings] rows
+    
+    Prefers the baked NumPy weights (.npz, scaler already folded in, see model_export.export_baked),
+    then the TFLite export (.tflite), then the .keras model itself; TensorFlow is only imported
+    for the latter two.
+    
+    Returns a callable mapping an (n, 4) input array to an (n, 1) prediction array.
+    The MAX_INFERENCE_MODELS most recently used models are cached per path and reloaded
+    when the model or scaler files change, checked at most every MODEL_RELOAD_CHECK_INTERVAL
+    seconds. Raises FileNotFoundError if the model doesn't exist.
+    """
+    model_path = Path(model_path)
+    now = time.monotonic()
+    
+    cached = _inference_models.get(model_path)
+    if cached is not None and now - cached[0] < MODEL_RELOAD_CHECK_INTERVAL:
+        _inference_models.move_to_end(model_path)
+        return cached[2]
+    
+    scaler_path = Path(scaler_path)
+    paths = (
+        model_path,
+        model_path.with_suffix('.tflite'),
+        model_path.with_suffix('.npz'),
+        scaler_path,
+        scaler_path.with_suffix('.save'),
+    )
+    mtimes = tuple(path.stat().st_mtime if path.exists() else None for path in paths)
+    
+    if cached is not None and cached[1] == mtimes:
+        _inference_models[model_path] = (now, mtimes, cached[2])
+        _inference_models.move_to_end(model_path)
+        return cached[2]
+    
+    run_model = _build_inference_model(model_path, scaler_path)
+    _inference_models[model_path] = (now, mtimes, run_model)
+    _inference_models.move_to_end(model_path)
+    
+    if len(_inference_models) > MAX_INFERENCE_MODELS:
+        _inference_models.popitem(last=False)
+    
+    return run_model
+
+def invalidate_inference_model(model_path):
+    """Drop a cached model so the next load_inference_model call reloads it, e.g. right after retraining"""
+    _inference_models.pop(Path(model_path), None)
+
+def _build_inference_model(model_path, scaler_path):
+    """Create the inference callable for load_inference_model"""
+    baked_path = model_path.with_suffix('.npz')
+    if baked_path.exists():
+        return _load_baked_model(baked_path)
+    
+    if not model_path.exists():
+        raise FileNotFoundError(f"Model file not found at {model_path}")
+    
+    mean, scale = load_scaler_stats(scaler_path)
+    run_scaled = _load_tf_model(model_path)
+    
+    return lambda inputs: run_scaled((np.asarray(inputs, dtype=np.float32) - mean) / scale)
+
+def _load_baked_model(baked_path):
+    """Three dense layers in plain NumPy, taking raw (unscaled) inputs"""
+    with np.load(baked_path) as weights:
+        w1, b1, w2, b2, w3, b3 = (weights[name] for name in ('w1', 'b1', 'w2', 'b2', 'w3', 'b3'))
+    
+    def run_baked(inputs):
+        hidden = np.maximum(np.asarray(inputs, dtype=np.float64) @ w1 + b1, 0.0)
+        hidden = np.maximum(hidden @ w2 + b2, 0.0)
+        return hidden @ w3 + b3
+    
+    return run_baked
+
+def _load_tf_model(model_path):
+    """Load the TFLite export, or else the Keras model, as a callable on scaled inputs"""
+    import tensorflow as tf
+    
+    tflite_path = model_path.with_suffix('.tflite')
+    if tflite_path.exists():
+        interpreter = tf.lite.Interpreter(model_path=str(tflite_path), num_threads=1)
+        interpreter.allocate_tensors()
+        input_index = interpreter.get_input_details()[0]['index']
+        output_index = interpreter.get_output_details()[0]['index']
+        batch_size = 1
         
-        if not model_path.exists():
-            print(f"Error: Model file not found at {model_path}", file=sys.stderr)
-            sys.exit(1)
+        def run_tflite(scaled_input):
+            nonlocal batch_size
+            scaled_input = np.asarray(scaled_input, dtype=np.float32)
             
-        self.model = tf.keras.models.load_model(str(model_path))
+            # Resize only when the batch size changes; single-row calls keep the initial allocation
+            if scaled_input.shape[0] != batch_size:
+                interpreter.resize_tensor_input(input_index, scaled_input.shape)
+                interpreter.allocate_tensors()
+                batch_size = scaled_input.shape[0]
+            
+            interpreter.set_tensor(input_index, scaled_input)
+            interpreter.invoke()
+            return interpreter.get_tensor(output_index)
+        
+        return run_tflite
+    
+    # No TFLite export yet (run model_export.py), fall back to the Keras model.
+    # Call it through a traced tf.function rather than model.predict, which builds
+    # a tf.data pipeline on every call.
+    model = tf.keras.models.load_model(str(model_path))
+    infer = tf.function(
+        lambda x: model(x, training=False),
+        input_signature=[tf.TensorSpec(shape=(None, 4), dtype=tf.float32)]
+    )
+    
+    return lambda scaled_input: infer(np.asarray(scaled_input, dtype=np.float32)).numpy()
+
+def _clamp(raw, income, expenses, month):
+    """Clip a raw prediction to reasonable bounds around current expenses
+    
+    - Base range: 80% to 120% of current expenses
+    - Festival season (Oct-Dec) allows up to 30% increase, new year (Jan-Feb) at most 10% reduction
+    - With income: at most 30% of income or 50% increase, at least 1% of income or 50% reduction
+    """
+    min_prediction = expenses * (0.9 if 1 <= month <= 2 else 0.8)
+    max_prediction = expenses * (1.3 if 10 <= month <= 12 else 1.2)
+    
+    if income > 0:
+        max_prediction = min(max_prediction, income * 0.3, expenses * 1.5)
+        min_prediction = max(min_prediction, income * 0.01, expenses * 0.5)
+    
+    return min(max_prediction, max(min_prediction, float(raw)))
+
+def clip_predictions(raw, income, expenses, month):
+    """Vectorized version of _clamp for batches of predictions"""
+    min_prediction = expenses * np.where((month >= 1) & (month <= 2), 0.9, 0.8)
+    max_prediction = expenses * np.where((month >= 10) & (month <= 12), 1.3, 1.2)
+    
+    has_income = income > 0
+    max_allowed = np.minimum(income * 0.3, expenses * 1.5)
+    min_allowed = np.maximum(income * 0.01, expenses * 0.5)
+    max_prediction = np.where(has_income, np.minimum(max_prediction, max_allowed), max_prediction)
+    min_prediction = np.where(has_income, np.maximum(min_prediction, min_allowed), min_prediction)
+    
+    return np.clip(raw, min_prediction, max_prediction)
+
+class ExpensePredictor:
+    def __init__(self, verbose=True):
+        # Per-request diagnostics on stderr; too noisy for the long-running prediction server
+        self.verbose = verbose
         
-        if not scaler_path.exists():
-            print(f"Error: Scaler file not found at {scaler_path}", file=sys.stderr)
-            sys.exit(1)
+        self.model_path = SCRIPT_DIR / 'expense_predictor.keras'
+        self.scaler_path = SCRIPT_DIR / 'scaler.npz'
+        
+        if not self.model_path.exists():
+            raise FileNotFoundError(f"Model file not found at {self.model_path}")
+            
+        if not has_scaler(self.scaler_path):
+            raise FileNotFoundError(f"Scaler file not found at {self.scaler_path}")
             
-        self.scaler = joblib.load(str(scaler_path))
+        # Model the cached outputs below were computed with (see _refresh_model)
+        self._model = self.model
+        
+        # Reused input buffer for single-row predictions
+        self._buf = np.empty((1, 4), dtype=np.float64)
+        
+        # Raw model outputs keyed by quantized inputs
+        self._predict_raw = lru_cache(maxsize=PREDICTION_CACHE_SIZE)(self._forward)
 
-    def predict(self, income, expenses, month, savings):
-        try:
-            # Input validation
+    @property
+    def model(self):
+        """Inference model, reloaded when the model files change (see load_inference_model)"""
+        return load_inference_model(self.model_path, self.scaler_path)
+
+    def _refresh_model(self):
+        """Return the current model, clearing cached outputs if it was reloaded since they were computed"""
+        model = self.model
+        if model is not self._model:
+            self._model = model
+            self._predict_raw.cache_clear()
+        return model
+
+    def _forward(self, income, expenses, month, savings):
+        """Run the model, returning the unclipped prediction"""
+        self._buf[0] = (income, expenses, month, savings)
+        return float(self._model(self._buf)[0][0])
+
+    def validate_input(self, income, expenses, month, savings):
+        """Validate a prediction input, returning it with expenses adjusted if needed"""
+        if self.verbose:
             print(f"Validating input: income={income}, expenses={expenses}, month={month}, savings={savings}", file=sys.stderr)
+        
+        if not isinstance(income, (int, float)) or not isinstance(expenses, (int, float)):
+            raise ValueError(f"Income and expenses must be numbers. Got: income={type(income)}, expenses={type(expenses)}")
+        
+        if income <= 0:
+            raise ValueError(f"Income must be positive, got {income}")
             
-            if not isinstance(income, (int, float)) or not isinstance(expenses, (int, float)):
-                raise ValueError(f"Income and expenses must be numbers. Got: income={type(income)}, expenses={type(expenses)}")
-            
-            if income <= 0:
-                raise ValueError(f"Income must be positive, got {income}")
-                
-            # If expenses are 0 or very low, set a minimum based on income
-            if expenses <= 0:
-                expenses = max(income * 0.1, 1000)  # At least 10% of income or 1000
+        # If expenses are 0 or very low, set a minimum based on income
+        if expenses <= 0:
+            expenses = max(income * 0.1, 1000)  # At least 10% of income or 1000
+            if self.verbose:
                 print(f"Setting minimum expenses to {expenses}", file=sys.stderr)
-                
-            if month < 1 or month > 12:
-                raise ValueError(f"Month must be between 1 and 12, got {month}")
-            
-            # Prepare input data
-            input_data = np.array([[income, expenses, month, savings]])
-            print(f"Input data shape: {input_data.shape}", file=sys.stderr)
-            print(f"Input values: {input_data[0].tolist()}", file=sys.stderr)
             
-            # Scale input data
-            try:
-                scaled_input = self.scaler.transform(input_data)
-                print(f"Scaled input: {scaled_input.tolist()}", file=sys.stderr)
-            except Exception as e:
-                print(f"Error during scaling: {str(e)}", file=sys.stderr)
-                raise
-            
-            # Make prediction
-            try:
-                raw_prediction = self.model.predict(scaled_input, verbose=0)[0][0]
-                print(f"Raw prediction: {raw_prediction}", file=sys.stderr)
-            except Exception as e:
-                print(f"Error during model prediction: {str(e)}", file=sys.stderr)
-                raise
+        if month < 1 or month > 12:
+            raise ValueError(f"Month must be between 1 and 12, got {month}")
+        
+        return income, expenses, month, savings
+
+    def predict_batch(self, inputs):
+        """Predict for an (n, 4) array of already validated [income, expenses, month, savings] rows"""
+        inputs = np.asarray(inputs, dtype=np.float64)
+        raw_predictions = self._refresh_model()(_quantize_rows(inputs))[:, 0]
+        return clip_predictions(raw_predictions, inputs[:, 0], inputs[:, 1], inputs[:, 2])
+
+    def predict_validated(self, income, expenses, month, savings):
+        """Predict for one already validated input (see validate_input)"""
+        # Make prediction (cached on quantized inputs)
+        try:
+            self._refresh_model()
+            raw_prediction = self._predict_raw(
+                _quantize(income), _quantize(expenses), month, _quantize(savings)
+            )
+        except Exception as e:
+            print(f"Error during model prediction: {str(e)}", file=sys.stderr)
+            raise
+        
+        # Post-process prediction: clip to reasonable bounds
+        final_prediction = _clamp(raw_prediction, income, expenses, month)
+        
+        if self.verbose:
+            print(f"Raw prediction: {raw_prediction}", file=sys.stderr)
+            print(f"Final prediction: {final_prediction}", file=sys.stderr)
+        
+        return final_prediction
+
+    def predict(self, income, expenses, month, savings):
+        try:
+            # Input validation
+            income, expenses, month, savings = self.validate_input(income, expenses, month, savings)
             
-            # Post-process prediction
-            try:
-                # 1. Base range: 80% to 120% of current expenses
-                min_prediction = expenses * 0.8  # Allow 20% reduction
-                max_prediction = expenses * 1.2  # Allow 20% increase
-                
-                print(f"Initial bounds: min={min_prediction}, max={max_prediction}", file=sys.stderr)
-                
-                # 2. Adjust for seasonal patterns
-                if 10 <= month <= 12:  # Festival season
-                    max_prediction = expenses * 1.3  # Allow up to 30% increase in festival season
-                    print(f"Festival season adjustment: max={max_prediction}", file=sys.stderr)
-                elif 1 <= month <= 2:  # New year period
-                    min_prediction = expenses * 0.9  # Less reduction in new year
-                    print(f"New year adjustment: min={min_prediction}", file=sys.stderr)
-                
-                # 3. Ensure prediction is reasonable relative to income
-                if income > 0:
-                    max_allowed = min(income * 0.3, expenses * 1.5)  # Cap at 30% of income or 50% increase
-                    min_allowed = max(income * 0.01, expenses * 0.5)  # At least 1% of income or 50% reduction
-                    max_prediction = min(max_prediction, max_allowed)
-                    min_prediction = max(min_prediction, min_allowed)
-                
-                print(f"Income-adjusted bounds: min={min_prediction}, max={max_prediction}", file=sys.stderr)
-                
-                # Clip prediction to reasonable bounds
-                final_prediction = float(np.clip(raw_prediction, min_prediction, max_prediction))
-                print(f"Final prediction: {final_prediction}", file=sys.stderr)
-                
-                return final_prediction
-                
-            except Exception as e:
-                print(f"Error during post-processing: {str(e)}", file=sys.stderr)
-                raise
+            return self.predict_validated(income, expenses, month, savings)
             
         except Exception as e:
             print(f"Error in prediction: {str(e)}", file=sys.stderr)
-            sys.exit(1)
+            raise
 
 def main():
     if len(sys.argv) != 5:
@@ -0,0 +1,87 @@
+import tensorflow as tf
+import numpy as np
+import joblib
+import sys
+from pathlib import Path
+
+from expense_predictor import load_scaler_stats, save_scaler_stats
+
+# Get the directory containing this script
+SCRIPT_DIR = Path(__file__).parent.absolute()
+
+def export_tflite(model, model_path):
+    """Write a dynamic-range quantized TFLite copy of a Keras model next to its .keras file"""
+    tflite_path = Path(model_path).with_suffix('.tflite')
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    tflite_path.write_bytes(converter.convert())
+
+    return tflite_path
+
+def export_baked(model, model_path, mean, scale):
+    """Write the model's weights, with the scaler folded into the first layer, next to its .keras file
+    
+    The network is Dense(relu) -> Dense(relu) -> Dense. Since
+    ((x - mean) / scale) @ W1 + b1 == x @ (W1 / scale[:, None]) + (b1 - (mean / scale) @ W1),
+    the baked weights take raw [income, expenses, month, savings] rows and run in plain NumPy
+    (see expense_predictor.load_inference_model). Dropout is a no-op at inference and has no weights.
+    """
+    dense_layers = [layer for layer in model.layers if layer.weights]
+    activations = [layer.get_config().get('activation') for layer in dense_layers]
+    if activations != ['relu', 'relu', 'linear']:
+        raise ValueError(f"Cannot bake model with layer activations {activations}")
+    
+    (w1, b1), (w2, b2), (w3, b3) = (
+        [np.asarray(weight, dtype=np.float64) for weight in layer.get_weights()] for layer in dense_layers
+    )
+    mean = np.asarray(mean, dtype=np.float64)
+    scale = np.asarray(scale, dtype=np.float64)
+    
+    # Kept in float64: raw incomes are in the millions, so the folded first layer
+    # subtracts two large, nearly equal terms
+    baked_path = Path(model_path).with_suffix('.npz')
+    np.savez(
+        baked_path,
+        w1=w1 / scale[:, None], b1=b1 - (mean / scale) @ w1,
+        w2=w2, b2=b2,
+        w3=w3, b3=b3
+    )
+    
+    return baked_path
+
+def export_legacy_scaler(scaler_path):
+    """Convert a pickled StandardScaler (.save) into scaler stats (.npz)"""
+    scaler = joblib.load(str(scaler_path))
+    npz_path = Path(scaler_path).with_suffix('.npz')
+    save_scaler_stats(npz_path, scaler.mean_, scaler.scale_)
+    return npz_path
+
+def export_saved_model(model_path, scaler_path):
+    """Export inference artifacts (TFLite and baked NumPy weights) for an existing .keras model file"""
+    model = tf.keras.models.load_model(str(model_path))
+    return export_tflite(model, model_path), export_baked(model, model_path, *load_scaler_stats(scaler_path))
+
+def main():
+    """Export inference artifacts for the base model and every personalized model"""
+    model_paths = [SCRIPT_DIR / 'expense_predictor.keras']
+    model_paths += sorted((SCRIPT_DIR / 'user_models').glob('*/expense_predictor.keras'))
+
+    for model_path in model_paths:
+        if not model_path.exists():
+            print(f"Skipping missing model {model_path}", file=sys.stderr)
+            continue
+
+        try:
+            legacy_scaler_path = model_path.parent / 'scaler.save'
+            if legacy_scaler_path.exists():
+                npz_path = export_legacy_scaler(legacy_scaler_path)
+                print(f"Exported {legacy_scaler_path} to {npz_path}")
+            
+            tflite_path, baked_path = export_saved_model(model_path, model_path.parent / 'scaler.npz')
+            print(f"Exported {model_path} to {tflite_path} and {baked_path}")
+        except Exception as e:
+            print(f"Error exporting {model_path}: {str(e)}", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -149,6 +149,79 @@ async function updateUserModel(userId, transactions) {
   });
 }
 
+/**
+ * Update several users' models in one Python process (parallel workers, one TensorFlow import each)
+ */
+async function updateUserModels(userTransactions) {
+  return new Promise((resolve, reject) => {
+    const manifestFile = join(USER_MODELS_DIR, `batch_${Date.now()}_manifest.json`);
+    const dataFiles = {};
+    
+    const cleanup = () => {
+      for (const file of [...Object.values(dataFiles), manifestFile]) {
+        try {
+          fs.unlinkSync(file);
+        } catch (e) {
+          console.error('Error removing temp file:', e);
+        }
+      }
+    };
+    
+    try {
+      // Write each user's transactions and a manifest mapping user ids to those files
+      for (const [userId, transactions] of Object.entries(userTransactions)) {
+        const tempDataFile = join(USER_MODELS_DIR, `${userId}_temp_data.json`);
+        fs.writeFileSync(tempDataFile, JSON.stringify(transactions));
+        dataFiles[userId] = tempDataFile;
+      }
+      fs.writeFileSync(manifestFile, JSON.stringify(dataFiles));
+      
+      const scriptPath = join(ML_DIR, 'train_all_users.py');
+      const pythonPath = 'python'; // Use system Python interpreter
+      
+      console.log(`Updating models for ${Object.keys(dataFiles).length} users`);
+      
+      const pythonProcess = spawn(pythonPath, [scriptPath, manifestFile]);
+      
+      let result = '';
+      let error = '';
+      
+      pythonProcess.stdout.on('data', (data) => {
+        result += data.toString();
+      });
+      
+      pythonProcess.stderr.on('data', (data) => {
+        error += data.toString();
+        console.error(`Python stderr: ${data}`);
+      });
+      
+      pythonProcess.on('close', (code) => {
+        cleanup();
+        console.log(`Python output: ${result}`);
+        
+        if (code !== 0) {
+          console.error(`Python process exited with code ${code}`);
+          console.error(`Error output: ${error}`);
+          reject(new Error(`Python script failed with code ${code}`));
+          return;
+        }
+        
+        resolve(true);
+      });
+      
+      pythonProcess.on('error', (err) => {
+        console.error('Failed to start Python process:', err);
+        cleanup();
+        reject(err);
+      });
+    } catch (error) {
+      console.error('Error updating user models:', error);
+      cleanup();
+      reject(error);
+    }
+  });
+}
+
 /**
  * Process all users and update their models
  */
@@ -160,32 +233,35 @@ async function processAllUsers() {
     const users = await User.find({}).lean();
     console.log(`Found ${users.length} users to process`);
     
-    let successCount = 0;
-    let failureCount = 0;
+    const userTransactions = {};
     
     for (const user of users) {
-      try {
-        console.log(`Processing user ${user._id}`);
-        
-        // Prepare transaction data
-        const transactions = await prepareUserTransactions(user._id);
-        
-        if (!transactions) {
-          console.log(`Skipping user ${user._id} due to insufficient data`);
-          continue;
-        }
-        
-        // Update user model
-        await updateUserModel(user._id.toString(), transactions);
-        successCount++;
-        
-      } catch (error) {
-        console.error(`Error processing user ${user._id}:`, error);
-        failureCount++;
+      console.log(`Processing user ${user._id}`);
+      
+      // Prepare transaction data
+      const transactions = await prepareUserTransactions(user._id);
+      
+      if (!transactions) {
+        console.log(`Skipping user ${user._id} due to insufficient data`);
+        continue;
       }
+      
+      userTransactions[user._id.toString()] = transactions;
+    }
+    
+    const userCount = Object.keys(userTransactions).length;
+    if (userCount === 0) {
+      console.log('Model retraining completed. No users with enough data');
+      return;
     }
     
-    console.log(`Model retraining completed. Success: ${successCount}, Failures: ${failureCount}`);
+    // Retrain all users in a single batch
+    try {
+      await updateUserModels(userTransactions);
+      console.log(`Model retraining completed for ${userCount} users`);
+    } catch (error) {
+      console.error('Model retraining finished with failures:', error);
+    }
   } catch (error) {
     console.error('Error in processAllUsers:', error);
   }
@@ -1,49 +1,100 @@
-import tensorflow as tf
 import numpy as np
 import pandas as pd
-from sklearn.preprocessing import StandardScaler
-import joblib
+import importlib.util
 import os
+import shutil
 import sys
 from pathlib import Path
 import json
 from datetime import datetime
+from functools import cached_property, lru_cache
+
+from expense_predictor import (
+    PREDICTION_CACHE_SIZE, _clamp, _quantize, _quantize_rows, clip_predictions, has_scaler,
+    invalidate_inference_model, load_inference_model, load_scaler_stats, save_scaler_stats
+)
 
 # Get the directory containing this script
 SCRIPT_DIR = Path(__file__).parent.absolute()
 
+# Base model shared by every user
+BASE_MODEL_PATH = SCRIPT_DIR / 'expense_predictor.keras'
+BASE_SCALER_PATH = SCRIPT_DIR / 'scaler.npz'
+
+def _load_base():
+    """Load the base inference model (cached, and reloaded when its files change, by load_inference_model)
+    
+    Raises FileNotFoundError if the base model files are missing.
+    """
+    return load_inference_model(BASE_MODEL_PATH, BASE_SCALER_PATH)
+
+# Columns read back from a user's transaction data and their types.
+# Dates stay strings and are parsed explicitly, since rows written at different times use different ISO formats.
+TRANSACTION_DTYPES = {'_id': 'string', 'amount': 'float64', 'type': 'category', 'date': 'string'}
+
+# pandas' multithreaded pyarrow CSV parser is used when pyarrow is installed
+CSV_ENGINE = 'pyarrow' if importlib.util.find_spec('pyarrow') else 'c'
+
 class PersonalizedExpensePredictor:
     def __init__(self, user_id):
         """Initialize a personalized expense predictor for a specific user"""
         self.user_id = user_id
         self.user_dir = SCRIPT_DIR / 'user_models' / user_id
-        self.user_dir.mkdir(parents=True, exist_ok=True)
+        
+        # Nothing is written to disk here: the user directory and model files are
+        # only created once there is data to store (see _ensure_user_model)
         
         # Paths for user-specific models and data
         self.model_path = self.user_dir / 'expense_predictor.keras'
-        self.scaler_path = self.user_dir / 'scaler.save'
+        self.scaler_path = self.user_dir / 'scaler.npz'
         self.data_path = self.user_dir / 'transaction_data.csv'
         self.metadata_path = self.user_dir / 'metadata.json'
         
-        # Load or initialize metadata
-        self.metadata = self._load_metadata()
+        # Scaler is loaded on first use (see the scaler_stats property)
+        self._scaler_stats = None
         
-        # Check if we have a personalized model, otherwise use base model
-        if not self.model_path.exists() or not self.scaler_path.exists():
-            self._initialize_from_base_model()
+        # (personal, base) models the cached outputs below were computed with (see _refresh_models)
+        self._models = None
+        
+        # Reused input buffer for single-row predictions
+        self._buf = np.empty((1, 4), dtype=np.float64)
+        
+        # Raw (blended) model outputs keyed by quantized inputs
+        self._predict_raw = lru_cache(maxsize=PREDICTION_CACHE_SIZE)(self._forward)
+    
+    @property
+    def model(self):
+        """Personalized inference model (the base model until one exists), reloaded when its files change"""
+        try:
+            return load_inference_model(self.model_path, self.scaler_path)
+        except FileNotFoundError:
+            return _load_base()
+    
+    @property
+    def scaler_stats(self):
+        """Personalized scaler (mean, scale) for training, loaded on first use (the base scaler until one exists)"""
+        if self._scaler_stats is None:
+            scaler_path = self.scaler_path if has_scaler(self.scaler_path) else BASE_SCALER_PATH
+            self._scaler_stats = load_scaler_stats(scaler_path)
+        return self._scaler_stats
+    
+    @cached_property
+    def metadata(self):
+        """User model metadata, read from disk on first access"""
+        return self._load_metadata()
     
     def _load_metadata(self):
-        """Load or initialize metadata for the user model"""
+        """Load metadata for the user model, or defaults if none has been saved yet"""
         if self.metadata_path.exists():
             with open(self.metadata_path, 'r') as f:
                 return json.load(f)
         else:
-            # Initialize with default metadata
-            metadata = {
+            # Default metadata, saved with the first update
+            return {
                 'created_at': datetime.now().isoformat(),
                 'last_trained': None,
                 'training_count': 0,
-                'transaction_count': 0,
+                'transaction_count': self._count_transactions(),
                 'base_model_weight': 1.0,  # Weight for base model (1.0 = 100% base model)
                 'personal_model_weight': 0.0,  # Weight for personal model (0.0 = 0% personal model)
                 'performance_metrics': {
@@ -51,33 +102,43 @@ class PersonalizedExpensePredictor:
                     'mse': None
                 }
             }
-            self._save_metadata(metadata)
-            return metadata
     
     def _save_metadata(self, metadata=None):
         """Save metadata to file"""
         if metadata is None:
             metadata = self.metadata
         
+        self.user_dir.mkdir(parents=True, exist_ok=True)
         with open(self.metadata_path, 'w') as f:
             json.dump(metadata, f, indent=2)
     
+    def _ensure_user_model(self):
+        """Create the user directory and seed it from the base model if needed"""
+        self.user_dir.mkdir(parents=True, exist_ok=True)
+        
+        if not self.model_path.exists() or not has_scaler(self.scaler_path):
+            self._initialize_from_base_model()
+    
     def _initialize_from_base_model(self):
         """Copy the base model and scaler to user directory"""
-        base_model_path = SCRIPT_DIR / 'expense_predictor.keras'
-        base_scaler_path = SCRIPT_DIR / 'scaler.save'
-        
-        if not base_model_path.exists() or not base_scaler_path.exists():
+        if not BASE_MODEL_PATH.exists() or not has_scaler(BASE_SCALER_PATH):
             print(f"Error: Base model files not found", file=sys.stderr)
             return False
         
-        # Load and save base model to user directory
+        # Copy the base model files as-is, no need to deserialize them
         try:
-            base_model = tf.keras.models.load_model(str(base_model_path))
-            base_model.save(str(self.model_path))
+            shutil.copyfile(BASE_MODEL_PATH, self.model_path)
+            
+            for suffix in ('.tflite', '.npz'):
+                base_export_path = BASE_MODEL_PATH.with_suffix(suffix)
+                if base_export_path.exists():
+                    shutil.copyfile(base_export_path, self.model_path.with_suffix(suffix))
             
-            base_scaler = joblib.load(str(base_scaler_path))
-            joblib.dump(base_scaler, str(self.scaler_path))
+            save_scaler_stats(self.scaler_path, *load_scaler_stats(BASE_SCALER_PATH))
+            
+            # Drop anything loaded before the user model existed
+            self._scaler_stats = None
+            self._predict_raw.cache_clear()
             
             print(f"Initialized user model from base model for user {self.user_id}")
             return True
@@ -91,33 +152,63 @@ class PersonalizedExpensePredictor:
         Args:
             transactions_df: DataFrame with columns [amount, type, date, currency]
         """
+        # Read the count before writing: new metadata is seeded from the data file,
+        # which would otherwise already include the rows appended below
+        previous_count = self.metadata.get('transaction_count', 0)
+        
+        self._ensure_user_model()
+        
+        if '_id' in transactions_df.columns:
+            transactions_df = transactions_df.drop_duplicates(subset=['_id'])
+        
         # Prepare data for storage
         if self.data_path.exists():
-            # Append to existing data
-            existing_data = pd.read_csv(self.data_path)
-            combined_data = pd.concat([existing_data, transactions_df], ignore_index=True)
-            # Remove duplicates based on transaction ID if present
-            if '_id' in combined_data.columns:
-                combined_data = combined_data.drop_duplicates(subset=['_id'])
-            combined_data.to_csv(self.data_path, index=False)
+            columns = pd.read_csv(self.data_path, nrows=0).columns
+            
+            # Skip transactions that are already stored (only the _id column is read)
+            if '_id' in columns and '_id' in transactions_df.columns:
+                stored_ids = self._read_transactions(['_id'])['_id'].astype(str)
+                transactions_df = transactions_df[~transactions_df['_id'].astype(str).isin(stored_ids)]
+            
+            # Append only the new rows, in the existing column order
+            transactions_df.reindex(columns=columns).to_csv(
+                self.data_path, mode='a', header=False, index=False
+            )
         else:
             # Create new data file
             transactions_df.to_csv(self.data_path, index=False)
         
-        # Update metadata
-        self.metadata['transaction_count'] = self._count_transactions()
+        # Update metadata (transactions_df now holds only the rows that were appended)
+        self.metadata['transaction_count'] = previous_count + len(transactions_df)
         self._save_metadata()
         
         return True
     
+    def _read_transactions(self, columns=tuple(TRANSACTION_DTYPES)):
+        """Read the given columns of the user's stored transactions with explicit dtypes
+        
+        Columns missing from the file (e.g. _id for data stored without one) are skipped.
+        """
+        header = pd.read_csv(self.data_path, nrows=0).columns
+        columns = [column for column in columns if column in header]
+        
+        return pd.read_csv(
+            self.data_path,
+            engine=CSV_ENGINE,
+            usecols=list(columns),
+            dtype={column: TRANSACTION_DTYPES[column] for column in columns}
+        )
+    
     def _count_transactions(self):
-        """Count the number of transactions in the data file"""
+        """Count the number of transactions in the data file
+        
+        Only used to seed new metadata; afterwards the count is kept up to date by add_transaction_data.
+        """
         if not self.data_path.exists():
             return 0
         
         try:
-            data = pd.read_csv(self.data_path)
-            return len(data)
+            return len(self._read_transactions(['amount']))
         except:
             return 0
     
@@ -127,7 +218,7 @@ class PersonalizedExpensePredictor:
             return False
         
         # Check if we have enough transactions
-        if self._count_transactions() < min_transactions:
+        if self.metadata['transaction_count'] < min_transactions:
             return False
         
         # Check last training date
@@ -147,62 +238,53 @@ class PersonalizedExpensePredictor:
         
         try:
             # Load transaction data
-            data = pd.read_csv(self.data_path)
-            
-            # Group by month to get monthly totals
-            data['date'] = pd.to_datetime(data['date'])
-            data['month'] = data['date'].dt.month
-            data['year_month'] = data['date'].dt.strftime('%Y-%m')
-            
-            # Calculate monthly aggregates
-            monthly_data = data.groupby(['year_month', 'month', 'type']).agg({
-                'amount': 'sum'
-            }).reset_index()
-            
-            # Pivot to get income and expenses columns
-            monthly_pivot = monthly_data.pivot_table(
-                index=['year_month', 'month'],
-                columns='type',
-                values='amount',
-                fill_value=0
-            ).reset_index()
-            
-            # Rename columns and calculate savings
-            if 'income' not in monthly_pivot.columns or 'expense' not in monthly_pivot.columns:
-                print(f"Insufficient data types for user {self.user_id}", file=sys.stderr)
-                return None, None
+            data = self._read_transactions()
             
-            monthly_pivot['savings'] = monthly_pivot['income'] - monthly_pivot['expense']
+            # Appends skip stored transactions, but drop any duplicates that slipped through
+            if '_id' in data.columns:
+                data = data.drop_duplicates(subset=['_id'])
             
-            # Prepare X and y for training
-            # X: current month's [income, expenses, month, savings]
-            # y: next month's expenses
+            dates = pd.to_datetime(data['date'], utc=True, format='ISO8601', cache=True)
+            amounts = data['amount'].to_numpy(dtype=np.float64)
+            types = data['type'].to_numpy()
+            is_income = types == 'income'
+            is_expense = types == 'expense'
             
-            # Sort by year_month
-            monthly_pivot = monthly_pivot.sort_values('year_month')
+            if not is_income.any() or not is_expense.any():
+                print(f"Insufficient data types for user {self.user_id}", file=sys.stderr)
+                return None, None
             
-            # Create features and target
-            X_data = []
-            y_data = []
+            # Bucket transactions by calendar month (months since year 0)
+            bucket = (dates.dt.year * 12 + dates.dt.month - 1).to_numpy(dtype=np.int64)
+            first_bucket = bucket.min()
+            bucket -= first_bucket
+            n_buckets = bucket.max() + 1
             
-            for i in range(len(monthly_pivot) - 1):
-                current = monthly_pivot.iloc[i]
-                next_month = monthly_pivot.iloc[i + 1]
-                
-                X_data.append([
-                    current['income'],
-                    current['expense'],
-                    current['month'],
-                    current['savings']
-                ])
-                
-                y_data.append(next_month['expense'])
+            # Monthly totals in a single pass per type
+            income = np.bincount(bucket, weights=np.where(is_income, amounts, 0.0), minlength=n_buckets)
+            expense = np.bincount(bucket, weights=np.where(is_expense, amounts, 0.0), minlength=n_buckets)
+            
+            # Keep only months that have transactions, in chronological order
+            months_present = np.flatnonzero(np.bincount(bucket, minlength=n_buckets))
+            income = income[months_present]
+            expense = expense[months_present]
+            month = (months_present + first_bucket) % 12 + 1
             
-            if not X_data or not y_data:
+            # X: current month's [income, expenses, month, savings]
+            # y: next month's expenses
+            X = np.stack([
+                income[:-1],
+                expense[:-1],
+                month[:-1],
+                income[:-1] - expense[:-1]
+            ], axis=1)
+            y = expense[1:]
+            
+            if len(y) == 0:
                 print(f"Insufficient sequential data for user {self.user_id}", file=sys.stderr)
                 return None, None
             
-            return np.array(X_data), np.array(y_data)
+            return X, y
             
         except Exception as e:
             print(f"Error preparing training data: {str(e)}", file=sys.stderr)
@@ -216,13 +298,44 @@ class PersonalizedExpensePredictor:
             print(f"Insufficient data to train model for user {self.user_id}", file=sys.stderr)
             return False
         
+        self._ensure_user_model()
+        
+        # Only training needs TensorFlow; predictions run on the baked NumPy weights
+        import tensorflow as tf
+        from model_export import export_baked, export_tflite
+        
         try:
-            # Load existing model and scaler
+            # Load existing model for fine-tuning, recompiled with XLA
             model = tf.keras.models.load_model(str(self.model_path))
-            scaler = joblib.load(str(self.scaler_path))
+            model.compile(optimizer=tf.keras.optimizers.Adam(learning_rate=0.001),
+                          loss='mse',
+                          metrics=['mae'],
+                          jit_compile=True)
             
             # Scale input data
-            X_scaled = scaler.transform(X)
+            mean, scale = self.scaler_stats
+            X_scaled = ((X - mean) / scale).astype(np.float32)
+            y = y.astype(np.float32)
+            
+            # Hold out the last months for validation (as validation_split did)
+            n_val = max(1, int(len(X) * validation_split)) if validation_split > 0 else 0
+            n_train = len(X) - n_val
+            batch_size = min(32, n_train)  # Adjust batch size for small datasets
+            
+            train_dataset = (
+                tf.data.Dataset.from_tensor_slices((X_scaled[:n_train], y[:n_train]))
+                .cache()
+                .shuffle(n_train)
+                .batch(batch_size)
+                .prefetch(tf.data.AUTOTUNE)
+            )
+            val_dataset = None
+            if n_val:
+                val_dataset = (
+                    tf.data.Dataset.from_tensor_slices((X_scaled[n_train:], y[n_train:]))
+                    .batch(batch_size)
+                    .cache()
+                )
             
             # Train with early stopping
             early_stopping = tf.keras.callbacks.EarlyStopping(
@@ -233,16 +346,19 @@ class PersonalizedExpensePredictor:
             
             # Train the model
             history = model.fit(
-                X_scaled, y,
+                train_dataset,
                 epochs=epochs,
-                batch_size=min(32, len(X)),  # Adjust batch size for small datasets
-                validation_split=validation_split,
+                validation_data=val_dataset,
                 callbacks=[early_stopping],
                 verbose=verbose
             )
             
             # Save the updated model
             model.save(str(self.model_path))
+            export_tflite(model, self.model_path)
+            export_baked(model, self.model_path, mean, scale)
+            invalidate_inference_model(self.model_path)
+            self._predict_raw.cache_clear()
             
             # Update metadata
             self.metadata['last_trained'] = datetime.now().isoformat()
@@ -278,97 +394,93 @@ class PersonalizedExpensePredictor:
             print(f"Error training personalized model: {str(e)}", file=sys.stderr)
             return False
     
-    def predict(self, income, expenses, month, savings):
-        """Make a prediction using the personalized model"""
+    def _refresh_models(self):
+        """Return the current (personal, base) models, clearing cached outputs if either was reloaded
+        
+        The base model is None if its files are missing.
+        """
         try:
-            # Load model and scaler
-            model = tf.keras.models.load_model(str(self.model_path))
-            scaler = joblib.load(str(self.scaler_path))
+            base_model = _load_base()
+        except FileNotFoundError:
+            base_model = None
+        
+        models = (self.model, base_model)
+        if models != self._models:
+            self._models = models
+            self._predict_raw.cache_clear()
+        return models
+    
+    def _forward(self, income, expenses, month, savings):
+        """Run the personalized model (blended with the base model), returning the unclipped prediction"""
+        model, base_model = self._models
+        
+        # Make prediction
+        self._buf[0] = (income, expenses, month, savings)
+        prediction = model(self._buf)[0][0]
+        
+        # Apply hybrid weighting if we have both models
+        base_weight = self.metadata['base_model_weight']
+        personal_weight = self.metadata['personal_model_weight']
+        
+        # If we have a base model prediction, blend them
+        if base_weight > 0 and base_model is not None:
+            # Get base model prediction (both models take the same raw input)
+            base_prediction = base_model(self._buf)[0][0]
             
-            # Prepare input data
-            input_data = np.array([[income, expenses, month, savings]])
-            scaled_input = scaler.transform(input_data)
+            # Blend predictions
+            prediction = (base_prediction * base_weight) + (prediction * personal_weight)
+        
+        return float(prediction)
+    
+    def predict_batch(self, inputs):
+        """Make predictions for an (n, 4) array of [income, expenses, month, savings] rows"""
+        inputs = np.asarray(inputs, dtype=np.float64)
+        
+        try:
+            # Same quantized inputs as predict(), so batching doesn't change results
+            model_inputs = _quantize_rows(inputs)
             
-            # Make prediction
-            prediction = model.predict(scaled_input, verbose=0)[0][0]
+            model, base_model = self._refresh_models()
+            prediction = model(model_inputs)[:, 0]
             
-            # Apply hybrid weighting if we have both models
             base_weight = self.metadata['base_model_weight']
             personal_weight = self.metadata['personal_model_weight']
             
-            # If we have a base model prediction, blend them
-            if base_weight > 0:
-                # Load base model for comparison
-                base_model_path = SCRIPT_DIR / 'expense_predictor.keras'
-                base_scaler_path = SCRIPT_DIR / 'scaler.save'
-                
-                if base_model_path.exists() and base_scaler_path.exists():
-                    base_model = tf.keras.models.load_model(str(base_model_path))
-                    base_scaler = joblib.load(str(base_scaler_path))
-                    
-                    # Get base model prediction
-                    base_scaled_input = base_scaler.transform(input_data)
-                    base_prediction = base_model.predict(base_scaled_input, verbose=0)[0][0]
-                    
-                    # Blend predictions
-                    prediction = (base_prediction * base_weight) + (prediction * personal_weight)
-            
-            # Post-process prediction (similar to base model)
-            min_prediction = expenses * 0.8  # Allow 20% reduction
-            max_prediction = expenses * 1.2  # Allow 20% increase
-            
-            # Adjust for seasonal patterns
-            if 10 <= month <= 12:  # Festival season
-                max_prediction = expenses * 1.3
-            elif 1 <= month <= 2:  # New year period
-                min_prediction = expenses * 0.9
-            
-            # Ensure prediction is reasonable relative to income
-            if income > 0:
-                max_allowed = min(income * 0.3, expenses * 1.5)
-                min_allowed = max(income * 0.01, expenses * 0.5)
-                max_prediction = min(max_prediction, max_allowed)
-                min_prediction = max(min_prediction, min_allowed)
-            
-            # Clip prediction to reasonable bounds
-            final_prediction = float(np.clip(prediction, min_prediction, max_prediction))
-            
-            return final_prediction
+            if base_weight > 0 and base_model is not None:
+                base_prediction = base_model(model_inputs)[:, 0]
+                prediction = (base_prediction * base_weight) + (prediction * personal_weight)
+            
+            return clip_predictions(prediction, inputs[:, 0], inputs[:, 1], inputs[:, 2])
+            
+        except Exception as e:
+            print(f"Error in batched personalized prediction: {str(e)}", file=sys.stderr)
+            
+            # Fall back to row-by-row predictions, which handle their own errors
+            return np.array([self.predict(*row) for row in inputs.tolist()])
+    
+    def predict(self, income, expenses, month, savings):
+        """Make a prediction using the personalized model"""
+        try:
+            # Blended model output (cached on quantized inputs)
+            self._refresh_models()
+            prediction = self._predict_raw(
+                _quantize(income), _quantize(expenses), month, _quantize(savings)
+            )
+            
+            # Post-process prediction (same bounds as the base model)
+            return _clamp(prediction, income, expenses, month)
             
         except Exception as e:
             print(f"Error in personalized prediction: {str(e)}", file=sys.stderr)
             
             # Fall back to base model if available
             try:
-                base_model_path = SCRIPT_DIR / 'expense_predictor.keras'
-                base_scaler_path = SCRIPT_DIR / 'scaler.save'
+                # Get base model prediction
+                self._buf[0] = (income, expenses, month, savings)
+                base_prediction = _load_base()(self._buf)[0][0]
                 
-                if base_model_path.exists() and base_scaler_path.exists():
-                    base_model = tf.keras.models.load_model(str(base_model_path))
-                    base_scaler = joblib.load(str(base_scaler_path))
-                    
-                    # Get base model prediction
-                    input_data = np.array([[income, expenses, month, savings]])
-                    base_scaled_input = base_scaler.transform(input_data)
-                    base_prediction = base_model.predict(base_scaled_input, verbose=0)[0][0]
-                    
-                    # Apply post-processing
-                    min_prediction = expenses * 0.8
-                    max_prediction = expenses * 1.2
-                    
-                    if 10 <= month <= 12:
-                        max_prediction = expenses * 1.3
-                    elif 1 <= month <= 2:
-                        min_prediction = expenses * 0.9
-                    
-                    if income > 0:
-                        max_allowed = min(income * 0.3, expenses * 1.5)
-                        min_allowed = max(income * 0.01, expenses * 0.5)
-                        max_prediction = min(max_prediction, max_allowed)
-                        min_prediction = max(min_prediction, min_allowed)
-                    
-                    final_prediction = float(np.clip(base_prediction, min_prediction, max_prediction))
-                    return final_prediction
+                # Apply post-processing
+                return _clamp(base_prediction, income, expenses, month)
             except:
                 # If all else fails, return a simple estimate
                 return expenses * 1.05  # 5% increase as fallback
@@ -0,0 +1,204 @@
+import asyncio
+import json
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# Add the current directory to the path so we can import the model modules
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from expense_predictor import ExpensePredictor
+from personalized_model import PersonalizedExpensePredictor
+
+# Address the Node.js server connects to (see prediction_client.js)
+HOST = os.environ.get('ML_PREDICT_HOST', '127.0.0.1')
+PORT = int(os.environ.get('ML_PREDICT_PORT', '5055'))
+
+# Requests arriving within this window (seconds) are scored in one model call
+BATCH_WINDOW = 0.005
+MAX_BATCH = 64
+
+# Loaded once at startup and shared by every request
+base_predictor = None
+
+# Number of personalized predictors kept in memory, each with its own prediction cache
+MAX_CACHED_PREDICTORS = 256
+
+# user_id -> (model files mtime, PersonalizedExpensePredictor), least recently used first
+personalized_predictors = OrderedDict()
+
+
+def get_personalized_predictor(user_id):
+    """Return a cached personalized predictor, reloading it if the user's model was retrained
+
+    Model file changes are picked up by load_inference_model; the predictor itself only
+    needs rebuilding when its metadata (blend weights) changes.
+    """
+    cached = personalized_predictors.get(user_id)
+    if cached is not None:
+        mtime, model = cached
+        if _model_mtime(model) == mtime:
+            personalized_predictors.move_to_end(user_id)
+            return model
+
+    model = PersonalizedExpensePredictor(user_id)
+    personalized_predictors[user_id] = (_model_mtime(model), model)
+    personalized_predictors.move_to_end(user_id)
+
+    if len(personalized_predictors) > MAX_CACHED_PREDICTORS:
+        personalized_predictors.popitem(last=False)
+
+    return model
+
+
+def _model_mtime(model):
+    """Modification time of a user's metadata (None before it is first saved)"""
+    try:
+        return model.metadata_path.stat().st_mtime
+    except FileNotFoundError:
+        return None
+
+
+def run_batch(batch):
+    """Score a batch of queued requests, one model call per predictor"""
+    groups = {}
+    for row, user_id, future in batch:
+        groups.setdefault(user_id, []).append((row, future))
+
+    for user_id, items in groups.items():
+        try:
+            model = get_personalized_predictor(user_id) if user_id else base_predictor
+
+            # A lone request takes the single-row path so it can hit the LRU cache.
+            # Base model rows were already validated in handle_request.
+            if len(items) == 1:
+                row = items[0][0]
+                predictions = [model.predict(*row) if user_id else model.predict_validated(*row)]
+            else:
+                predictions = model.predict_batch(np.array([row for row, _ in items]))
+
+            for (_, future), prediction in zip(items, predictions):
+                # The client may have disconnected while the batch was queued
+                if not future.done():
+                    future.set_result(float(prediction))
+        except Exception as e:
+            print(f"Error in batched prediction: {str(e)}", file=sys.stderr)
+            for _, future in items:
+                if not future.done():
+                    future.set_exception(e)
+
+
+async def batch_worker(queue):
+    """Collect requests arriving within BATCH_WINDOW and score them together"""
+    loop = asyncio.get_running_loop()
+
+    while True:
+        batch = [await queue.get()]
+        deadline = loop.time() + BATCH_WINDOW
+
+        while len(batch) < MAX_BATCH:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        run_batch(batch)
+
+
+async def handle_request(request, queue):
+    """Validate a single prediction request and wait for its batched result"""
+    income = float(request['income'])
+    expenses = float(request['expenses'])
+    month = int(request['month'])
+    savings = float(request['savings'])
+    user_id = str(request['user_id']) if request.get('user_id') else None
+
+    row = (income, expenses, month, savings)
+    if user_id is None:
+        row = base_predictor.validate_input(*row)
+
+    future = asyncio.get_running_loop().create_future()
+    await queue.put((row, user_id, future))
+    return await future
+
+
+async def handle_connection(reader, writer, queue):
+    """Read newline-delimited JSON requests and answer each with a JSON line"""
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+
+            try:
+                prediction = await handle_request(json.loads(line), queue)
+                response = {'prediction': float(prediction)}
+            except Exception as e:
+                print(f"Error handling prediction request: {str(e)}", file=sys.stderr)
+                response = {'error': str(e)}
+
+            writer.write((json.dumps(response) + '\n').encode())
+            await writer.drain()
+    finally:
+        writer.close()
+
+
+def wait_for_stdin_eof(loop, stop):
+    """Block until stdin is closed, then stop the server
+
+    Node never writes to this pipe; it is closed when the Node process exits for any
+    reason, including signals that skip its 'exit' handlers.
+    """
+    sys.stdin.buffer.read()
+    loop.call_soon_threadsafe(stop.set)
+
+
+async def serve(exit_on_stdin_eof=False):
+    queue = asyncio.Queue()
+    worker = asyncio.create_task(batch_worker(queue))
+
+    # Set to shut the server down; otherwise it runs until interrupted
+    stop = asyncio.Event()
+    if exit_on_stdin_eof:
+        threading.Thread(
+            target=wait_for_stdin_eof, args=(asyncio.get_running_loop(), stop), daemon=True
+        ).start()
+
+    server = await asyncio.start_server(
+        lambda reader, writer: handle_connection(reader, writer, queue), HOST, PORT
+    )
+
+    # Node.js waits for this line before sending requests
+    print(f"READY {HOST}:{PORT}", flush=True)
+
+    try:
+        async with server:
+            await stop.wait()
+    finally:
+        worker.cancel()
+
+
+def main():
+    global base_predictor
+
+    try:
+        base_predictor = ExpensePredictor(verbose=False)
+    except Exception as e:
+        print(f"Error loading base model: {str(e)}", file=sys.stderr)
+        sys.exit(1)
+
+    try:
+        # Started by prediction_client.js: exit together with the Node process
+        asyncio.run(serve(exit_on_stdin_eof='--exit-on-stdin-eof' in sys.argv[1:]))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
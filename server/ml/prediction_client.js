@@ -0,0 +1,191 @@
+import { spawn } from 'child_process';
+import net from 'net';
+import { fileURLToPath } from 'url';
+import { dirname, join } from 'path';
+
+const __filename = fileURLToPath(import.meta.url);
+const __dirname = dirname(__filename);
+
+const ML_DIR = join(__dirname);
+const HOST = process.env.ML_PREDICT_HOST || '127.0.0.1';
+const PORT = parseInt(process.env.ML_PREDICT_PORT || '5055', 10);
+const REQUEST_TIMEOUT_MS = 10000;
+const STARTUP_TIMEOUT_MS = 60000;
+
+/**
+ * Error reported by the prediction server for a request it received (e.g. invalid input).
+ * Unlike connection failures, the CLI scripts would fail the same way, so don't fall back on it.
+ */
+export class PredictionServerError extends Error {}
+
+// Resolves once the prediction server has loaded its model and is listening
+let serverReady = null;
+
+// The running prediction server process, if this Node process started one
+let serverProcess = null;
+
+/**
+ * Stop the prediction server when Node exits (registered while a server is running)
+ */
+function killPredictionServer() {
+  if (serverProcess) {
+    serverProcess.kill();
+  }
+}
+
+/**
+ * Forget a prediction server process that has exited or failed to start
+ */
+function clearPredictionServer(pythonProcess) {
+  // A late event from an earlier process must not clear a newer server
+  if (serverProcess !== pythonProcess) {
+    return;
+  }
+
+  serverProcess = null;
+  serverReady = null;
+  process.removeListener('exit', killPredictionServer);
+}
+
+/**
+ * Start the persistent Python prediction server (once per Node process)
+ */
+function startPredictionServer() {
+  if (serverReady) {
+    return serverReady;
+  }
+
+  serverReady = new Promise((resolve, reject) => {
+    const scriptPath = join(ML_DIR, 'predict_server.py');
+    const pythonPath = 'python'; // Use system Python interpreter
+
+    console.log('Starting prediction server:', scriptPath);
+
+    // The server exits when its stdin pipe closes, so it never outlives this process
+    // (process 'exit' handlers don't run when Node is killed by a signal)
+    const pythonProcess = spawn(pythonPath, [scriptPath, '--exit-on-stdin-eof'], {
+      env: { ...process.env, ML_PREDICT_HOST: HOST, ML_PREDICT_PORT: PORT.toString() },
+      stdio: ['pipe', 'pipe', 'pipe']
+    });
+
+    serverProcess = pythonProcess;
+    process.on('exit', killPredictionServer);
+
+    // Don't wait forever on a server that neither becomes ready nor exits
+    const startupTimer = setTimeout(() => {
+      console.error(`Prediction server not ready after ${STARTUP_TIMEOUT_MS} ms, stopping it`);
+      clearPredictionServer(pythonProcess);
+      pythonProcess.kill();
+      reject(new Error('Prediction server startup timed out'));
+    }, STARTUP_TIMEOUT_MS);
+
+    let output = '';
+
+    pythonProcess.stdout.on('data', (data) => {
+      output += data.toString();
+      if (output.includes('READY')) {
+        clearTimeout(startupTimer);
+        resolve();
+      }
+    });
+
+    pythonProcess.stderr.on('data', (data) => {
+      console.error(`Prediction server stderr: ${data}`);
+    });
+
+    pythonProcess.on('exit', (code) => {
+      console.error(`Prediction server exited with code ${code}`);
+      clearTimeout(startupTimer);
+      clearPredictionServer(pythonProcess);
+      reject(new Error(`Prediction server exited with code ${code}`));
+    });
+
+    pythonProcess.on('error', (err) => {
+      console.error('Failed to start prediction server:', err);
+      clearTimeout(startupTimer);
+      clearPredictionServer(pythonProcess);
+      reject(err);
+    });
+  });
+
+  return serverReady;
+}
+
+/**
+ * Send one JSON request to the prediction server and read back the prediction
+ */
+function sendRequest(payload) {
+  return new Promise((resolve, reject) => {
+    const socket = net.createConnection({ host: HOST, port: PORT });
+    let response = '';
+
+    socket.setTimeout(REQUEST_TIMEOUT_MS);
+
+    socket.on('connect', () => {
+      socket.write(JSON.stringify(payload) + '\n');
+    });
+
+    socket.on('data', (data) => {
+      response += data.toString();
+      if (!response.includes('\n')) {
+        return;
+      }
+
+      socket.end();
+
+      try {
+        const result = JSON.parse(response.trim());
+        if (result.error) {
+          reject(new PredictionServerError(result.error));
+          return;
+        }
+
+        const prediction = parseFloat(result.prediction);
+        if (isNaN(prediction)) {
+          reject(new Error('Invalid prediction value received from prediction server'));
+          return;
+        }
+
+        resolve(prediction);
+      } catch (err) {
+        reject(err);
+      }
+    });
+
+    // Closed before a full response line arrived (no-op once the promise has settled)
+    socket.on('close', () => {
+      reject(new Error('Prediction server closed the connection without a response'));
+    });
+
+    socket.on('timeout', () => {
+      socket.destroy();
+      reject(new Error('Prediction server request timed out'));
+    });
+
+    socket.on('error', reject);
+  });
+}
+
+/**
+ * Get a prediction from the persistent prediction server, starting it if needed.
+ * Pass userId to use the user's personalized model.
+ * Rejects with PredictionServerError if the server rejected the request itself.
+ */
+export async function requestPrediction({ userId, income, expenses, month, savings }) {
+  const payload = { income, expenses, month, savings };
+  if (userId) {
+    payload.user_id = userId.toString();
+  }
+
+  try {
+    return await sendRequest(payload);
+  } catch (error) {
+    if (error.code !== 'ECONNREFUSED') {
+      throw error;
+    }
+  }
+
+  // Nothing listening yet - start the server and retry once
+  await startPredictionServer();
+  return sendRequest(payload);
+}
@@ -0,0 +1,77 @@
+import os
+import sys
+import json
+from pathlib import Path
+
+# One TensorFlow thread per worker so parallel workers don't oversubscribe the CPUs.
+# Set before any worker imports TensorFlow; loky workers inherit the environment.
+os.environ.setdefault('TF_NUM_INTRAOP_THREADS', '1')
+os.environ.setdefault('TF_NUM_INTEROP_THREADS', '1')
+
+from joblib import Parallel, delayed
+
+# Add the current directory to the path so we can import the personalized_model module
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+# Get the directory containing this script
+SCRIPT_DIR = Path(__file__).parent.absolute()
+USER_MODELS_DIR = SCRIPT_DIR / 'user_models'
+
+def _train_one(user_id, data_file=None):
+    """Retrain a single user's model, first adding the transactions in data_file if given"""
+    # Imported in the worker so the parent process never loads TensorFlow
+    from personalized_model import PersonalizedExpensePredictor
+    from update_user_model import update_user_model
+
+    try:
+        if data_file:
+            return user_id, update_user_model(user_id, data_file)
+
+        model = PersonalizedExpensePredictor(user_id)
+        return user_id, model.train_model(epochs=150)
+    except Exception as e:
+        print(f"Error training model for user {user_id}: {str(e)}", file=sys.stderr)
+        return user_id, False
+
+def train_all_users(data_files=None, n_jobs=-1):
+    """Retrain user models in parallel worker processes
+
+    Args:
+        data_files: dict of user_id -> JSON transaction file to add before retraining.
+            If omitted, every user with stored transaction data is retrained.
+        n_jobs: number of worker processes (-1 = one per CPU)
+    """
+    if data_files is None:
+        data_files = {
+            data_path.parent.name: None
+            for data_path in sorted(USER_MODELS_DIR.glob('*/transaction_data.csv'))
+        }
+
+    if not data_files:
+        print("No user models to train")
+        return {}
+
+    results = Parallel(n_jobs=n_jobs, backend='loky')(
+        delayed(_train_one)(user_id, data_file) for user_id, data_file in data_files.items()
+    )
+    return dict(results)
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2:
+        print("Usage: python train_all_users.py [<manifest.json>]", file=sys.stderr)
+        sys.exit(1)
+
+    # Optional manifest: {"<user_id>": "<transaction data file>", ...}
+    data_files = None
+    if len(sys.argv) == 2:
+        with open(sys.argv[1], 'r') as f:
+            data_files = json.load(f)
+
+    results = train_all_users(data_files)
+
+    failures = [user_id for user_id, success in results.items() if not success]
+    print(f"Trained {len(results) - len(failures)} user models, {len(failures)} failed")
+    for user_id in failures:
+        print(f"Failed to train model for user {user_id}", file=sys.stderr)
+
+    sys.exit(0 if not failures else 1)
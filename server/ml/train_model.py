@@ -2,39 +2,37 @@ import tensorflow as tf
 import numpy as np
 import pandas as pd
 from sklearn.preprocessing import StandardScaler
-import joblib
 from pathlib import Path
 
+from expense_predictor import save_scaler_stats
+from model_export import export_baked, export_tflite
+
 # Get the directory containing this script
 SCRIPT_DIR = Path(__file__).parent.absolute()
 
 # Generate synthetic data
-np.random.seed(42)
+rng = np.random.default_rng(42)
 n_samples = 1000
 
+# All noise in one draw: income, expense and next-month variation.
+# Bounded at 4 standard deviations so expenses can never go negative.
+noise = np.clip(rng.standard_normal((n_samples, 3)), -4, 4)
+
 # Generate more realistic random data with patterns
 # Base income around your current income level
 base_income = 8312466  # Your current income
-income = np.random.normal(base_income, base_income * 0.05, n_samples)  # 5% variation
+income = base_income * (1 + 0.05 * noise[:, 0])  # 5% variation
 
 # Base expenses around your current expense level
 base_expense = 44718  # Your current expense level
-expense_variation = np.random.normal(0, base_expense * 0.2, n_samples)  # 20% variation
-base_expenses = base_expense + expense_variation
+base_expenses = base_expense * (1 + 0.2 * noise[:, 1])  # 20% variation
 
-month = np.random.randint(1, 13, n_samples)
+month = rng.integers(1, 13, n_samples)
 savings = income - base_expenses
 
-# Add seasonal patterns (higher expenses in certain months)
-month_effect = np.zeros(n_samples)
-# Slight increase in festival months (Oct-Dec)
-month_effect[month >= 10] += base_expense * 0.15  # 15% increase
-# Slight decrease in beginning of year (Jan-Feb)
-month_effect[month <= 2] -= base_expense * 0.05   # 5% decrease
-expenses = base_expenses + month_effect
-
-# Ensure expenses don't go negative
-expenses = np.maximum(expenses, 0)
+# Add seasonal patterns: 15% increase in festival months (Oct-Dec),
+# 5% decrease at the beginning of the year (Jan-Feb)
+expenses = base_expenses + base_expense * np.where(month >= 10, 0.15, np.where(month <= 2, -0.05, 0.0))
 
 # Create DataFrame
 data = pd.DataFrame({
@@ -49,14 +47,14 @@ data.to_csv(SCRIPT_DIR / 'synthetic_expense_data.csv', index=False)
 
 # Prepare data for model
 X = data[['income', 'expenses', 'month', 'savings']].values
-y = expenses * (1 + np.random.normal(0, 0.05, n_samples))  # Next month's expenses with 5% variation
+y = expenses * (1 + 0.05 * noise[:, 2])  # Next month's expenses with 5% variation
 
 # Scale the data
 scaler = StandardScaler()
 X_scaled = scaler.fit_transform(X)
 
 # Save the scaler
-joblib.dump(scaler, SCRIPT_DIR / 'scaler.save')
+save_scaler_stats(SCRIPT_DIR / 'scaler.npz', scaler.mean_, scaler.scale_)
 
 # Create and train the model with regularization
 inputs = tf.keras.Input(shape=(4,))
@@ -69,7 +67,28 @@ outputs = tf.keras.layers.Dense(1, kernel_regularizer=tf.keras.regularizers.l2(0
 model = tf.keras.Model(inputs=inputs, outputs=outputs)
 model.compile(optimizer=tf.keras.optimizers.Adam(learning_rate=0.001), 
               loss='mse',
-              metrics=['mae'])
+              metrics=['mae'],
+              jit_compile=True)
+
+# Build the input pipelines once: the last 20% is held out for validation
+# (as validation_split did), the rest is cached and reshuffled every epoch
+n_val = int(n_samples * 0.2)
+X_scaled = X_scaled.astype(np.float32)
+y = y.astype(np.float32)
+
+train_dataset = (
+    tf.data.Dataset.from_tensor_slices((X_scaled[:-n_val], y[:-n_val]))
+    .cache()
+    .shuffle(n_samples - n_val)
+    .batch(32)
+    .prefetch(tf.data.AUTOTUNE)
+)
+val_dataset = (
+    tf.data.Dataset.from_tensor_slices((X_scaled[-n_val:], y[-n_val:]))
+    .batch(32)
+    .cache()
+    .prefetch(tf.data.AUTOTUNE)
+)
 
 # Train the model with early stopping
 early_stopping = tf.keras.callbacks.EarlyStopping(
@@ -79,10 +98,9 @@ early_stopping = tf.keras.callbacks.EarlyStopping(
 )
 
 history = model.fit(
-    X_scaled, y,
+    train_dataset,
     epochs=200,
-    batch_size=32,
-    validation_split=0.2,
+    validation_data=val_dataset,
     callbacks=[early_stopping],
     verbose=1
 )
@@ -90,6 +108,14 @@ history = model.fit(
 # Save the model
 model.save(SCRIPT_DIR / 'expense_predictor.keras')
 
+# Save a quantized TFLite copy for inference
+tflite_path = export_tflite(model, SCRIPT_DIR / 'expense_predictor.keras')
+
+# Save the weights with the scaler folded in for TensorFlow-free inference
+baked_path = export_baked(model, SCRIPT_DIR / 'expense_predictor.keras', scaler.mean_, scaler.scale_)
+
 print(f"Model saved to {SCRIPT_DIR / 'expense_predictor.keras'}")
-print(f"Scaler saved to {SCRIPT_DIR / 'scaler.save'}")
+print(f"TFLite model saved to {tflite_path}")
+print(f"Baked model saved to {baked_path}")
+print(f"Scaler saved to {SCRIPT_DIR / 'scaler.npz'}")
 print(f"Training data saved to {SCRIPT_DIR / 'synthetic_expense_data.csv'}")
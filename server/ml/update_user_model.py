@@ -4,20 +4,34 @@ import pandas as pd
 from pathlib import Path
 import os
 
+try:
+    import orjson
+except ImportError:  # Optional faster parser, fall back to the standard library
+    orjson = None
+
 # Add the current directory to the path so we can import the personalized_model module
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from personalized_model import PersonalizedExpensePredictor
 
+# Fields of each transaction record sent by the Node.js server
+TRANSACTION_COLUMNS = ['_id', 'amount', 'type', 'date', 'currency']
+
+def load_transactions(data_file):
+    """Load a JSON transaction dump straight into a typed DataFrame"""
+    raw = Path(data_file).read_bytes()
+    transactions = orjson.loads(raw) if orjson is not None else json.loads(raw)
+    
+    df = pd.DataFrame.from_records(transactions, columns=TRANSACTION_COLUMNS)
+    df['amount'] = df['amount'].astype('float64')
+    df['date'] = pd.to_datetime(df['date'], utc=True, format='ISO8601', cache=True)
+    return df
+
 def update_user_model(user_id, data_file):
     """Update a user's personalized model with new transaction data"""
     try:
         # Load transaction data from JSON file
-        with open(data_file, 'r') as f:
-            transactions = json.load(f)
-        
-        # Convert to DataFrame
-        df = pd.DataFrame(transactions)
+        df = load_transactions(data_file)
         
         # Initialize personalized model
         model = PersonalizedExpensePredictor(user_id)
@@ -5,6 +5,7 @@ import Transaction from '../models/Transaction.js';
 import { fileURLToPath } from 'url';
 import { dirname, join } from 'path';
 import { getExchangeRates } from '../utils/currency.js';
+import { PredictionServerError, requestPrediction } from '../ml/prediction_client.js';
 import fs from 'fs';
 
 const __filename = fileURLToPath(import.meta.url);
@@ -12,8 +13,27 @@ const __dirname = dirname(__filename);
 
 const router = express.Router();
 
-// Helper function to run Python prediction script using the base model
+// User scalers are saved as scaler.npz; models trained before that have a pickled scaler.save
+function userScalerExists(userModelDir) {
+  return ['scaler.npz', 'scaler.save'].some((name) => fs.existsSync(join(userModelDir, name)));
+}
+
+// Get a base model prediction from the prediction server, falling back to the CLI script
 async function getBasePrediction(income, expenses, month, savings) {
+  try {
+    return await requestPrediction({ income, expenses, month, savings });
+  } catch (error) {
+    // The script would reject the same request (e.g. invalid input), only slower
+    if (error instanceof PredictionServerError) {
+      throw error;
+    }
+    console.error('Prediction server unavailable, running prediction script:', error.message);
+    return runBasePredictionScript(income, expenses, month, savings);
+  }
+}
+
+// Helper function to run Python prediction script using the base model
+async function runBasePredictionScript(income, expenses, month, savings) {
   return new Promise((resolve, reject) => {
     const scriptPath = join(__dirname, '..', 'ml', 'expense_predictor.py');
     const pythonPath = 'python'; // Use system Python interpreter
@@ -164,14 +184,13 @@ router.get('/future-expenses', authenticateToken, async (req, res) => {
     // Check if user has a personalized model
     const userModelDir = join(__dirname, '..', 'ml', 'user_models', req.user.id);
     const userModelPath = join(userModelDir, 'expense_predictor.keras');
-    const userScalerPath = join(userModelDir, 'scaler.save');
     const userMetadataPath = join(userModelDir, 'metadata.json');
     
     let usePersonalizedModel = false;
     let modelMetadata = null;
     
     // Check if user has a personalized model
-    if (fs.existsSync(userModelPath) && fs.existsSync(userScalerPath)) {
+    if (fs.existsSync(userModelPath) && userScalerExists(userModelDir)) {
       usePersonalizedModel = true;
       
       // Load metadata if available
@@ -239,8 +258,22 @@ router.get('/future-expenses', authenticateToken, async (req, res) => {
   }
 });
 
-// Helper function to run Python prediction script using personalized model
+// Get a personalized prediction from the prediction server, falling back to the CLI script
 async function getPersonalizedPrediction(userId, income, expenses, month, savings) {
+  try {
+    return await requestPrediction({ userId, income, expenses, month, savings });
+  } catch (error) {
+    // The script would reject the same request (e.g. invalid input), only slower
+    if (error instanceof PredictionServerError) {
+      throw error;
+    }
+    console.error('Prediction server unavailable, running personalized prediction script:', error.message);
+    return runPersonalizedPredictionScript(userId, income, expenses, month, savings);
+  }
+}
+
+// Helper function to run Python prediction script using personalized model
+async function runPersonalizedPredictionScript(userId, income, expenses, month, savings) {
   return new Promise((resolve, reject) => {
     const scriptPath = join(__dirname, '..', 'ml', 'personalized_predict.py');
     const pythonPath = 'python'; // Use system Python interpreter
@@ -372,11 +405,10 @@ router.get('/model-status', authenticateToken, async (req, res) => {
     // Check if user has a personalized model
     const userModelDir = join(__dirname, '..', 'ml', 'user_models', req.user.id);
     const userModelPath = join(userModelDir, 'expense_predictor.keras');
-    const userScalerPath = join(userModelDir, 'scaler.save');
     const userMetadataPath = join(userModelDir, 'metadata.json');
     
     // If no personalized model exists
-    if (!fs.existsSync(userModelPath) || !fs.existsSync(userScalerPath)) {
+    if (!fs.existsSync(userModelPath) || !userScalerExists(userModelDir)) {
       return res.json({
         hasPersonalizedModel: false,
         message: 'Using base prediction model. Train a personalized model to improve prediction accuracy.'